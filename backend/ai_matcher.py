@@ -1,84 +1,831 @@
 import numpy as np
 from PIL import Image
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 import hashlib
+import json
+import os
+import re
+
+import ai_kernels
+
+DOWNLOAD_WORKERS = 16
+
+def _make_session():
+    """Build a requests session with keep-alive connection pooling"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=DOWNLOAD_WORKERS, pool_maxsize=32)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except Exception as e:
+    print(f"⚠️ OpenCV not available: {e}")
+    CV2_AVAILABLE = False
+
+try:
+    import tensorflow as tf
+    from tensorflow.keras.applications import InceptionResNetV2
+    from tensorflow.keras.applications.inception_resnet_v2 import preprocess_input
+    TF_AVAILABLE = True
+except Exception as e:
+    print(f"⚠️ TensorFlow not available: {e}")
+    TF_AVAILABLE = False
+
+try:
+    import simsimd
+    SIMSIMD_AVAILABLE = True
+except Exception:
+    SIMSIMD_AVAILABLE = False
+
+try:
+    import onnxruntime
+    ONNX_AVAILABLE = True
+except Exception:
+    ONNX_AVAILABLE = False
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except Exception:
+    NUMBA_AVAILABLE = False
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except Exception:
+    FAISS_AVAILABLE = False
+
+# Pre-exported ONNX model (tf2onnx) picked up automatically when present
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ONNX_MODEL_PATH = os.getenv('ONNX_MODEL_PATH', os.path.join(_BACKEND_DIR, 'inception_resnet_v2.onnx'))
+
+# OpenCV res10 SSD face detector (used instead of Haar when downloaded)
+FACE_PROTO_PATH = os.path.join(_BACKEND_DIR, 'deploy.prototxt')
+FACE_MODEL_PATH = os.path.join(_BACKEND_DIR, 'res10_300x300_ssd_iter_140000.caffemodel')
+
+# On-disk copy of the FAISS index so restarts keep past uploads
+INDEX_PATH = os.getenv('FAISS_INDEX_PATH', os.path.join(_BACKEND_DIR, 'unidentified.index'))
+INDEX_OWNERS_PATH = INDEX_PATH + '.owners.json'
+
+# Store embeddings as int8 (4x smaller, VNNI-friendly); set to 0 for float32
+INT8_FEATURES = os.getenv('INT8_FEATURES', '1') == '1'
+
+def _cloudinary_thumb(url, size):
+    """Rewrite a Cloudinary URL so the CDN serves a pre-sized thumbnail"""
+    if '/upload/' not in url:
+        return url
+    return re.sub(
+        r'/upload/',
+        f'/upload/w_{size},h_{size},c_fill,q_auto,f_auto/',
+        url,
+        count=1
+    )
+
+def quantize_features(features):
+    """Quantize L2-normalized feature rows to int8 with a fixed 127 scale"""
+    features = np.atleast_2d(np.asarray(features, dtype=np.float32))
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return np.round(features / norms * 127).astype(np.int8)
+
+def cosine_matrix_int8(A_q, B_q):
+    """Approximate pairwise cosine similarity from int8-quantized rows"""
+    return (A_q.astype(np.int32) @ B_q.T.astype(np.int32)).astype(np.float32) / (127 * 127)
+
+def cosine_matrix(A, B):
+    """Pairwise cosine similarity between rows of A (M,D) and B (N,D)"""
+    if SIMSIMD_AVAILABLE:
+        # SimSIMD dispatches to AVX-512/NEON kernels when present
+        return 1 - np.asarray(
+            simsimd.cdist(A.astype(np.float32), B.astype(np.float32), metric='cosine')
+        )
+    A = A / np.linalg.norm(A, axis=1, keepdims=True)
+    B = B / np.linalg.norm(B, axis=1, keepdims=True)
+    # One GEMM replaces M*N Python-level dot products
+    return A @ B.T
+
+def hamming_matrix(hashes1, hashes2):
+    """Pairwise Hamming distance between two uint64 hash arrays"""
+    xor = np.bitwise_xor.outer(hashes1, hashes2)
+    bits = np.unpackbits(xor[..., np.newaxis].view(np.uint8), axis=-1)
+    return bits.sum(axis=-1)
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def best_hamming(missing_hashes, unid_hashes, offsets):
+        """Best (minimum) Hamming distance per person range, in parallel"""
+        n = offsets.shape[0] - 1
+        out = np.empty(n, np.int64)
+        for i in prange(n):
+            best = 64
+            for j in range(offsets[i], offsets[i + 1]):
+                for k in range(missing_hashes.shape[0]):
+                    x = missing_hashes[k] ^ unid_hashes[j]
+                    count = 0
+                    while x:
+                        x &= x - np.uint64(1)
+                        count += 1
+                    if count < best:
+                        best = count
+            out[i] = best
+        return out
+else:
+    def best_hamming(missing_hashes, unid_hashes, offsets):
+        """NumPy fallback: segmented minimum over the distance matrix"""
+        distances = hamming_matrix(missing_hashes, unid_hashes).min(axis=0)
+        return np.minimum.reduceat(distances, offsets[:-1])
+
+class FeatureStore:
+    """Structure-of-arrays store for face features: one contiguous float32
+    matrix plus parallel owner/image arrays, so similarity queries are a
+    single GEMM over linear memory instead of dict/list pointer chasing."""
+
+    def __init__(self, dim=1536, quantize=INT8_FEATURES):
+        self.quantized = quantize
+        dtype = np.int8 if quantize else np.float32
+        self.matrix = np.empty((0, dim), dtype=dtype)
+        self.owners = np.empty(0, dtype=np.int32)
+        self.images = []
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def append_batch(self, features, owner_id, image_urls):
+        """Append an owner's feature rows and remember its image URLs"""
+        if self.quantized:
+            features = quantize_features(features)
+        else:
+            features = np.ascontiguousarray(features, dtype=np.float32)
+        self.matrix = np.concatenate([self.matrix, features])
+        self.owners = np.concatenate([
+            self.owners,
+            np.full(len(features), owner_id, dtype=np.int32)
+        ])
+        self.images.extend(image_urls)
+
+    def owner_offsets(self):
+        """Start index of each owner's block (owners are appended in order)"""
+        return np.searchsorted(self.owners, np.arange(self.owners.max() + 1))
 
 class FaceMatcher:
     def __init__(self):
         """Initialize the FaceMatcher"""
+        self._hash_cache = {}
+        self.session = _make_session()
         print("✅ FaceMatcher initialized (simplified version)")
-    
+
     def get_image_hash(self, image_url):
         """Get perceptual hash of image"""
+        if image_url in self._hash_cache:
+            return self._hash_cache[image_url]
         try:
-            response = requests.get(image_url, timeout=10)
-            img = Image.open(BytesIO(response.content))
-            # Resize to small size for hashing
-            img = img.resize((8, 8), Image.Resampling.LANCZOS)
-            # Convert to grayscale
-            img = img.convert('L')
-            # Get pixel values
-            pixels = list(img.getdata())
-            # Calculate average
-            avg = sum(pixels) / len(pixels)
-            # Generate hash
-            bits = ''.join(['1' if px > avg else '0' for px in pixels])
-            return int(bits, 2)
+            # A 16px CDN thumbnail is plenty for an 8x8 hash
+            thumb_url = _cloudinary_thumb(image_url, 16)
+            response = self.session.get(thumb_url, timeout=10)
+            if CV2_AVAILABLE:
+                # Reduced decode only pays off on full-size originals; a
+                # CDN thumbnail is already tiny and must keep its pixels
+                flag = (cv2.IMREAD_REDUCED_GRAYSCALE_8 if thumb_url == image_url
+                        else cv2.IMREAD_GRAYSCALE)
+                data = np.frombuffer(response.content, np.uint8)
+                img = cv2.imdecode(data, flag)
+                if img is None:
+                    return 0
+                pixels = cv2.resize(img, (8, 8), interpolation=cv2.INTER_AREA).ravel()
+            else:
+                img = Image.open(BytesIO(response.content))
+                # Resize to small size for hashing
+                img = img.resize((8, 8), Image.Resampling.LANCZOS)
+                # Convert to grayscale
+                img = img.convert('L')
+                # Get pixel values
+                pixels = np.frombuffer(img.tobytes(), dtype=np.uint8)
+            # Threshold against the average and pack bits into a single uint64
+            bits = (pixels > pixels.mean()).astype(np.uint8)
+            image_hash = int(np.packbits(bits).view(np.uint64)[0])
+            self._hash_cache[image_url] = image_hash
+            return image_hash
         except Exception as e:
             print(f"Error generating hash: {e}")
             return 0
-    
+
     def calculate_similarity(self, hash1, hash2):
         """Calculate similarity based on hash difference"""
         if hash1 == 0 or hash2 == 0:
             return 0
-        
+
         # Calculate Hamming distance
-        xor = hash1 ^ hash2
-        distance = bin(xor).count('1')
-        
+        distance = (hash1 ^ hash2).bit_count()
+
         # Convert to similarity percentage (64 bits total)
         similarity = ((64 - distance) / 64) * 100
         return similarity
-    
+
     def compare_faces(self, face1_url, face2_url):
         """Compare two faces using perceptual hashing"""
         try:
             hash1 = self.get_image_hash(face1_url)
             hash2 = self.get_image_hash(face2_url)
-            
+
             similarity = self.calculate_similarity(hash1, hash2)
             return similarity
         except Exception as e:
             print(f"Error comparing faces: {e}")
             return 0
-    
+
     def find_matches(self, missing_person_images, unidentified_persons, threshold=70):
         """Find matches between missing person and unidentified persons"""
         matches = []
-        
+
+        # Warm the hash cache with parallel downloads before comparing
+        all_urls = list(dict.fromkeys(
+            list(missing_person_images)
+            + [img for u in unidentified_persons for img in u.get('images', [])]
+        ))
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            list(executor.map(self.get_image_hash, all_urls))
+
+        missing_hashes = np.array(
+            [self.get_image_hash(img) for img in missing_person_images],
+            dtype=np.uint64
+        )
+        missing_hashes = missing_hashes[missing_hashes != 0]
+
+        if missing_hashes.size == 0:
+            return matches
+
+        # Flatten all candidate hashes with per-person offsets so the whole
+        # cartesian product is reduced in a single kernel call
+        candidates = []
+        flat_hashes = []
+        counts = []
         for unidentified in unidentified_persons:
-            unidentified_id = str(unidentified.get('_id', 'unknown'))
             unidentified_images = unidentified.get('images', [])
-            
-            best_similarity = 0
-            
-            for missing_img in missing_person_images:
-                for unidentified_img in unidentified_images:
-                    similarity = self.compare_faces(missing_img, unidentified_img)
-                    best_similarity = max(best_similarity, similarity)
-                    
-                    if best_similarity >= threshold:
-                        break
-                if best_similarity >= threshold:
-                    break
-            
-            if best_similarity >= threshold:
+            hashes = np.array(
+                [self.get_image_hash(img) for img in unidentified_images],
+                dtype=np.uint64
+            )
+            hashes = hashes[hashes != 0]
+            if hashes.size == 0:
+                continue
+            candidates.append({
+                'id': str(unidentified.get('_id', 'unknown')),
+                'images': unidentified_images
+            })
+            flat_hashes.append(hashes)
+            counts.append(hashes.size)
+
+        if not candidates:
+            return matches
+
+        flat_hashes = np.concatenate(flat_hashes)
+        offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        best_distances = best_hamming(missing_hashes, flat_hashes, offsets)
+        similarities = (64 - best_distances) / 64 * 100
+
+        for candidate, similarity in zip(candidates, similarities):
+            similarity = float(similarity)
+            if similarity >= threshold:
                 matches.append({
-                    'unidentified_id': unidentified_id,
-                    'similarity': best_similarity,
-                    'unidentified_images': unidentified_images
+                    'unidentified_id': candidate['id'],
+                    'similarity': similarity,
+                    'unidentified_images': candidate['images']
                 })
-        
-        return matches
\ No newline at end of file
+
+        return matches
+
+class DeepFaceMatcher:
+    """Face matcher backed by InceptionResNetV2 deep features"""
+
+    FACE_SIZE = (299, 299)
+    PREDICT_BATCH_SIZE = 32
+    # Loose Hamming cutoff (of 64 bits) for the cheap pre-filter stage;
+    # keeps recall near-perfect while culling most negatives from the CNN
+    HASH_PREFILTER_DISTANCE = 20
+
+    def __init__(self):
+        """Initialize the model and face detector"""
+        if not TF_AVAILABLE or not CV2_AVAILABLE:
+            raise RuntimeError("TensorFlow and OpenCV are required for DeepFaceMatcher")
+
+        self._configure_opencv()
+
+        # Tensor-core GPUs (compute capability >= 7.0) get FP16 kernels
+        self._maybe_enable_mixed_precision()
+
+        # Global average pooling gives a 1536-d feature vector per face
+        self.model = InceptionResNetV2(weights='imagenet', include_top=False, pooling='avg')
+        # XLA-compiled graph avoids eager dispatch and retracing per call
+        self._infer = tf.function(
+            lambda x: self.model(x, training=False),
+            jit_compile=True,
+            input_signature=[tf.TensorSpec((None, 299, 299, 3), tf.float32)]
+        )
+        self.face_net = self._load_face_net()
+        self.face_cascade = None
+        if self.face_net is None:
+            # Haar cascade fallback when the SSD model files are absent
+            self.face_cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+            )
+        self._feature_cache = {}
+        self.session = _make_session()
+        self.onnx_session = self._load_onnx_session()
+
+        # Persistent ANN index over unidentified-person features: inner
+        # product over L2-normalized vectors is cosine similarity
+        self.index = faiss.IndexFlatIP(1536) if FAISS_AVAILABLE else None
+        self.index_owners = []
+        self._load_index()
+
+        # Cheap perceptual-hash stage used to pre-filter CNN candidates
+        self._hash_matcher = FaceMatcher()
+
+        # SoA corpus of missing-person embeddings: one contiguous matrix
+        # with parallel id/name lists, so matching is a linear-memory matvec
+        self.corpus = {
+            'emb': np.empty((0, 1536), dtype=np.float32),
+            'ids': [],
+            'names': []
+        }
+
+        print("✅ DeepFaceMatcher initialized (InceptionResNetV2)")
+
+    def corpus_load(self, documents):
+        """(Re)build the corpus from documents with stored embeddings"""
+        embeddings = []
+        ids = []
+        names = []
+        for doc in documents:
+            raw = doc.get('embedding')
+            if raw is None:
+                continue
+            embeddings.append(np.frombuffer(raw, dtype=np.float32))
+            ids.append(str(doc['_id']))
+            names.append(doc.get('name', ''))
+        self.corpus = {
+            'emb': np.stack(embeddings) if embeddings else np.empty((0, 1536), dtype=np.float32),
+            'ids': ids,
+            'names': names
+        }
+        print(f"✅ Embedding corpus loaded ({len(ids)} missing persons)")
+
+    def corpus_add(self, embedding, doc_id, name):
+        """Append one missing person's embedding row to the corpus"""
+        row = np.asarray(embedding, dtype=np.float32)[np.newaxis, :]
+        self.corpus['emb'] = np.concatenate([self.corpus['emb'], row])
+        self.corpus['ids'].append(doc_id)
+        self.corpus['names'].append(name)
+
+    def corpus_search(self, query_url, threshold=70):
+        """Best corpus matches for one query image, via a single matvec"""
+        if not self.corpus['ids']:
+            return []
+        query = self.embed(query_url)
+        if query is None:
+            return []
+        similarities = self.batch_similarity(query, self.corpus['emb'])
+        hits = np.where(similarities >= threshold)[0]
+        return [
+            {
+                'missing_person_id': self.corpus['ids'][i],
+                'name': self.corpus['names'][i],
+                'similarity': float(similarities[i])
+            }
+            for i in hits
+        ]
+
+    def embed(self, image_url):
+        """Deep feature vector for a single image URL (cached by URL)"""
+        return self._features_for_url(image_url)
+
+    @staticmethod
+    def batch_similarity(query_features, corpus_features):
+        """Similarity (%) of one query vector against a feature matrix"""
+        query = np.ascontiguousarray(query_features, dtype=np.float32)
+        corpus = np.ascontiguousarray(corpus_features, dtype=np.float32)
+        if ai_kernels.NUMBA_AVAILABLE and corpus.shape[0] < ai_kernels.SMALL_CORPUS_LIMIT:
+            similarities = ai_kernels.cosine_scores(query, corpus)
+        else:
+            similarities = cosine_matrix(query[np.newaxis, :], corpus)[0]
+        return (similarities + 1) / 2 * 100
+
+    def _load_index(self):
+        """Restore the persisted index; a fresh one starts empty.
+
+        Loads into locals and validates before assigning, so a missing or
+        corrupt owners file can never leave the index and its owner list
+        out of step."""
+        if self.index is None or not os.path.exists(INDEX_PATH):
+            return
+        try:
+            with open(INDEX_OWNERS_PATH) as fh:
+                owners = json.load(fh)
+            index = faiss.read_index(INDEX_PATH)
+            if len(owners) != index.ntotal:
+                raise ValueError(
+                    f"owner count {len(owners)} != index size {index.ntotal}"
+                )
+            self.index = index
+            self.index_owners = owners
+            print(f"✅ FAISS index loaded ({index.ntotal} vectors)")
+        except Exception as e:
+            print(f"⚠️ FAISS index load error: {e}")
+
+    def _save_index(self):
+        """Write the index and its owner ids to disk"""
+        if self.index is None:
+            return
+        try:
+            faiss.write_index(self.index, INDEX_PATH)
+            with open(INDEX_OWNERS_PATH, 'w') as fh:
+                json.dump(self.index_owners, fh)
+        except Exception as e:
+            print(f"⚠️ FAISS index save error: {e}")
+
+    def index_add(self, image_urls, owner_id):
+        """Embed images and add their features to the persistent index"""
+        if self.index is None:
+            return 0
+        self._cache_features_batch(image_urls)
+        features = [
+            self._feature_cache[url]
+            for url in image_urls if url in self._feature_cache
+        ]
+        if not features:
+            return 0
+        arr = np.stack(features)
+        arr /= np.linalg.norm(arr, axis=1, keepdims=True)
+        self.index.add(arr)
+        self.index_owners.extend([owner_id] * len(features))
+        self._save_index()
+        return len(features)
+
+    def search_index(self, query_urls, threshold=70, k=10):
+        """Search indexed persons for the closest matches to query images"""
+        if self.index is None or self.index.ntotal == 0:
+            return []
+        self._cache_features_batch(query_urls)
+        features = [
+            self._feature_cache[url]
+            for url in query_urls if url in self._feature_cache
+        ]
+        if not features:
+            return []
+        queries = np.stack(features)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        scores, indices = self.index.search(queries, min(k, self.index.ntotal))
+        best = {}
+        for row_scores, row_indices in zip(scores, indices):
+            for score, idx in zip(row_scores, row_indices):
+                if idx < 0:
+                    continue
+                owner = self.index_owners[idx]
+                similarity = (float(score) + 1) / 2 * 100
+                if similarity >= threshold and similarity > best.get(owner, 0):
+                    best[owner] = similarity
+        return [
+            {'unidentified_id': owner, 'similarity': similarity}
+            for owner, similarity in best.items()
+        ]
+
+    @staticmethod
+    def _configure_opencv():
+        """Enable OpenCV's SIMD paths and pin its thread pool"""
+        try:
+            cv2.setUseOptimized(True)
+            # Share cores fairly when several server workers run per host
+            workers = max(1, int(os.getenv('FLASK_WORKERS', '1')))
+            cv2.setNumThreads(max(1, (os.cpu_count() or 1) // workers))
+            if 'AVX2' not in cv2.getBuildInformation():
+                print("⚠️ OpenCV build has no AVX2 dispatch")
+        except Exception as e:
+            print(f"⚠️ OpenCV configuration failed: {e}")
+
+    @staticmethod
+    def _maybe_enable_mixed_precision():
+        """Enable float16 compute when the GPU has tensor cores"""
+        try:
+            gpus = tf.config.list_physical_devices('GPU')
+            if not gpus:
+                return
+            details = tf.config.experimental.get_device_details(gpus[0])
+            compute_capability = details.get('compute_capability')
+            if compute_capability and compute_capability[0] >= 7:
+                tf.keras.mixed_precision.set_global_policy('mixed_float16')
+                print("✅ Mixed precision (mixed_float16) enabled")
+        except Exception as e:
+            print(f"⚠️ Mixed precision detection failed: {e}")
+
+    def _load_onnx_session(self):
+        """Load an ONNX Runtime session when an exported model is available"""
+        if not ONNX_AVAILABLE or not os.path.exists(ONNX_MODEL_PATH):
+            return None
+        try:
+            # TensorRT/CUDA providers run fused FP16 kernels when present
+            preferred = [
+                'TensorrtExecutionProvider',
+                'CUDAExecutionProvider',
+                'CPUExecutionProvider'
+            ]
+            available = onnxruntime.get_available_providers()
+            providers = [p for p in preferred if p in available]
+            session = onnxruntime.InferenceSession(ONNX_MODEL_PATH, providers=providers)
+            print(f"✅ ONNX Runtime engine loaded ({providers[0]})")
+            return session
+        except Exception as e:
+            print(f"⚠️ ONNX engine load failed, using Keras: {e}")
+            return None
+
+    def download_image(self, image_url):
+        """Download image from URL as a BGR numpy array"""
+        try:
+            # Let the CDN resize instead of shipping multi-MB originals
+            response = self.session.get(_cloudinary_thumb(image_url, 299), timeout=10)
+            # cv2.imdecode uses libjpeg-turbo's SIMD IDCT; keep the native
+            # BGR layout so no full-image conversion pass is needed here
+            data = np.frombuffer(response.content, np.uint8)
+            return cv2.imdecode(data, cv2.IMREAD_COLOR)
+        except Exception as e:
+            print(f"Error downloading image: {e}")
+            return None
+
+    def _download_many(self, urls):
+        """Download several URLs in parallel, overlapping network latency"""
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            return dict(zip(urls, executor.map(self.download_image, urls)))
+
+    @staticmethod
+    def _load_face_net():
+        """Load the res10 SSD face detector when its model files exist"""
+        if not (os.path.exists(FACE_PROTO_PATH) and os.path.exists(FACE_MODEL_PATH)):
+            return None
+        try:
+            net = cv2.dnn.readNetFromCaffe(FACE_PROTO_PATH, FACE_MODEL_PATH)
+            if cv2.cuda.getCudaEnabledDeviceCount() > 0:
+                net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+                net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
+            print("✅ DNN face detector loaded (res10 SSD)")
+            return net
+        except Exception as e:
+            print(f"⚠️ DNN face detector load failed, using Haar: {e}")
+            return None
+
+    def _detect_face_dnn(self, image):
+        """Return the best face box (x, y, w, h) from the SSD detector"""
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, (300, 300), (104, 177, 123))
+        self.face_net.setInput(blob)
+        detections = self.face_net.forward()
+
+        best = detections[0, 0, detections[0, 0, :, 2].argmax()]
+        if best[2] < 0.5:
+            return None
+        x1, y1, x2, y2 = (best[3:7] * [width, height, width, height]).astype(int)
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(width, x2), min(height, y2)
+        if x2 <= x1 or y2 <= y1:
+            return None
+        return x1, y1, x2 - x1, y2 - y1
+
+    def _detect_face_haar(self, image):
+        """Return the largest face box (x, y, w, h) from the Haar cascade"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        faces = self.face_cascade.detectMultiScale(gray, 1.1, 4)
+        if len(faces) == 0:
+            return None
+        return max(faces, key=lambda f: f[2] * f[3])
+
+    def extract_face(self, image):
+        """Detect the best face in an image and return a 299x299 RGB crop"""
+        try:
+            # Detection runs on the decoded BGR image directly (the DNN
+            # expects BGR; Haar derives gray in one pass)
+            if self.face_net is not None:
+                box = self._detect_face_dnn(image)
+            else:
+                box = self._detect_face_haar(image)
+
+            if box is not None:
+                x, y, w, h = box
+                # Crop as a view, no copy until resize
+                face = image[y:y + h, x:x + w]
+            else:
+                # Fall back to the whole image
+                face = image
+
+            # INTER_AREA is faster and cleaner than linear when downscaling
+            interpolation = (
+                cv2.INTER_AREA if face.shape[0] > self.FACE_SIZE[1] else cv2.INTER_LINEAR
+            )
+            face = cv2.resize(face, self.FACE_SIZE, interpolation=interpolation)
+            # Only the small 299x299 crop pays for the RGB conversion
+            return cv2.cvtColor(face, cv2.COLOR_BGR2RGB)
+        except Exception as e:
+            print(f"Error extracting face: {e}")
+            return None
+
+    def extract_features(self, faces):
+        """Extract deep features for one face or a list of faces"""
+        if isinstance(faces, np.ndarray) and faces.ndim == 3:
+            return self.extract_features_batch([faces])[0]
+        return self.extract_features_batch(faces)
+
+    def extract_features_batch(self, faces):
+        """Extract deep features for a list of faces in a single forward pass"""
+        if len(faces) == 0:
+            return np.empty((0, 1536), dtype=np.float32)
+
+        # One stacked predict amortizes graph dispatch over the whole batch
+        if self.onnx_session is None and len(faces) > self.PREDICT_BATCH_SIZE:
+            # tf.data overlaps CPU resize/preprocess with model execution
+            ds = tf.data.Dataset.from_generator(
+                lambda: (cv2.resize(f, self.FACE_SIZE) for f in faces),
+                output_signature=tf.TensorSpec((299, 299, 3), tf.float32)
+            )
+            ds = ds.map(preprocess_input, num_parallel_calls=tf.data.AUTOTUNE)
+            ds = ds.batch(self.PREDICT_BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+            features = np.concatenate([self._infer(batch).numpy() for batch in ds])
+            return features.astype(np.float32)
+
+        arr = np.stack([cv2.resize(f, self.FACE_SIZE) for f in faces]).astype(np.float32)
+        arr = preprocess_input(arr)
+
+        if self.onnx_session is not None:
+            input_name = self.onnx_session.get_inputs()[0].name
+            features = self.onnx_session.run(None, {input_name: arr})[0]
+        else:
+            features = self._infer(arr).numpy()
+        return features.astype(np.float32)
+
+    def _features_for_url(self, url):
+        """Return cached deep features for a URL, computing them if needed"""
+        if url in self._feature_cache:
+            return self._feature_cache[url]
+        image = self.download_image(url)
+        if image is None:
+            return None
+        face = self.extract_face(image)
+        if face is None:
+            return None
+        features = self.extract_features_batch([face])[0]
+        self._feature_cache[url] = features
+        return features
+
+    def _cache_features_batch(self, urls):
+        """Compute and cache features for all uncached URLs in one model pass"""
+        uncached = [url for url in urls if url not in self._feature_cache]
+        images = self._download_many(uncached)
+
+        pending = []
+        faces = []
+        for url in uncached:
+            image = images.get(url)
+            if image is None:
+                continue
+            face = self.extract_face(image)
+            if face is not None:
+                pending.append(url)
+                faces.append(face)
+
+        if pending:
+            features = self.extract_features_batch(faces)
+            for url, feature in zip(pending, features):
+                self._feature_cache[url] = feature
+
+    def calculate_similarity(self, features1, features2):
+        """Calculate cosine similarity between two feature vectors"""
+        # vdot skips np.linalg.norm dispatch and merges the two sqrts into one
+        denom = np.sqrt(np.vdot(features1, features1) * np.vdot(features2, features2))
+        if denom == 0:
+            return 0
+        return float(np.dot(features1, features2) / denom)
+
+    def compare_faces(self, face1_url, face2_url):
+        """Compare two face images, returning similarity as a percentage"""
+        try:
+            self._cache_features_batch([face1_url, face2_url])
+            features1 = self._features_for_url(face1_url)
+            features2 = self._features_for_url(face2_url)
+            if features1 is None or features2 is None:
+                return 0
+
+            similarity = self.calculate_similarity(features1, features2)
+            return (similarity + 1) / 2 * 100
+        except Exception as e:
+            print(f"Error comparing faces: {e}")
+            return 0
+
+    def _hash_prefilter(self, missing_person_images, unidentified_persons):
+        """Drop candidates whose perceptual hashes are far from every
+        missing image, so only plausible pairs reach the CNN"""
+        matcher = self._hash_matcher
+        all_urls = list(dict.fromkeys(
+            list(missing_person_images)
+            + [img for u in unidentified_persons for img in u.get('images', [])]
+        ))
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            list(executor.map(matcher.get_image_hash, all_urls))
+
+        missing_hashes = np.array(
+            [matcher.get_image_hash(img) for img in missing_person_images],
+            dtype=np.uint64
+        )
+        missing_hashes = missing_hashes[missing_hashes != 0]
+        if missing_hashes.size == 0:
+            # Nothing to filter against; let everything through
+            return unidentified_persons
+
+        survivors = []
+        for unidentified in unidentified_persons:
+            hashes = np.array(
+                [matcher.get_image_hash(img) for img in unidentified.get('images', [])],
+                dtype=np.uint64
+            )
+            valid = hashes[hashes != 0]
+            # Keep candidates we could not hash rather than risk a miss
+            if valid.size < hashes.size or valid.size == 0:
+                survivors.append(unidentified)
+            elif hamming_matrix(missing_hashes, valid).min() <= self.HASH_PREFILTER_DISTANCE:
+                survivors.append(unidentified)
+        return survivors
+
+    def batch_compare(self, missing_person_images, unidentified_persons, threshold=70):
+        """Find matches for a missing person across all unidentified persons"""
+        try:
+            # Phase 0: cheap hash cascade before any CNN work
+            unidentified_persons = self._hash_prefilter(
+                missing_person_images, unidentified_persons
+            )
+            if not unidentified_persons:
+                return []
+
+            # Phase 1: embed every unique URL exactly once (cache-aware)
+            unique_urls = dict.fromkeys(missing_person_images)
+            for unidentified in unidentified_persons:
+                unique_urls.update(dict.fromkeys(unidentified.get('images', [])))
+            self._cache_features_batch(list(unique_urls))
+
+            missing_features = [
+                self._feature_cache[url]
+                for url in missing_person_images if url in self._feature_cache
+            ]
+            if not missing_features:
+                return []
+            missing_features = np.stack(missing_features)
+
+            # Phase 2: pack candidate features into one SoA store
+            store = FeatureStore()
+            candidates = []
+            for unidentified in unidentified_persons:
+                unidentified_id = str(unidentified.get('_id', 'unknown'))
+                unidentified_images = unidentified.get('images', [])
+                embedded_urls = [
+                    url for url in unidentified_images if url in self._feature_cache
+                ]
+                features = [self._feature_cache[url] for url in embedded_urls]
+                if features:
+                    # Only the URLs that embedded keep the store's rows and
+                    # image list parallel
+                    store.append_batch(np.stack(features), len(candidates), embedded_urls)
+                    candidates.append({
+                        'id': unidentified_id,
+                        'images': unidentified_images
+                    })
+
+            if not candidates:
+                return []
+
+            # One similarity matrix for every (missing, candidate) pair,
+            # then a segmented max over each candidate's block of columns
+            if store.quantized:
+                similarities = cosine_matrix_int8(
+                    quantize_features(missing_features), store.matrix
+                )
+            else:
+                similarities = cosine_matrix(missing_features, store.matrix)
+            column_best = similarities.max(axis=0)
+            best_per_candidate = np.maximum.reduceat(column_best, store.owner_offsets())
+            best_per_candidate = (best_per_candidate + 1) / 2 * 100
+
+            matches = []
+            for candidate, best_similarity in zip(candidates, best_per_candidate):
+                best_similarity = float(best_similarity)
+                if best_similarity >= threshold:
+                    matches.append({
+                        'unidentified_id': candidate['id'],
+                        'similarity': best_similarity,
+                        'unidentified_images': candidate['images']
+                    })
+
+            return matches
+        except Exception as e:
+            print(f"Error in batch compare: {e}")
+            return []
@@ -1,26 +1,45 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, current_app, request, jsonify, send_from_directory
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from flask_bcrypt import Bcrypt
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt
+from functools import wraps
 from bson import ObjectId
 from datetime import datetime, timedelta
-import json
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import os
+import re
+import tempfile
+import numpy as np
 import cloudinary
 import cloudinary.uploader
 
 from config import Config
 from models import User, MissingPerson, UnidentifiedPerson
-from ai_matcher import FaceMatcher
+from ai_matcher import FaceMatcher, DeepFaceMatcher
 
 app = Flask(__name__, static_folder='../frontend', static_url_path='')
 app.config.from_object(Config)
 
+# Serve the frontend from WSGI middleware when available: files go out
+# with caching headers without ever entering Flask's routing
+try:
+    from whitenoise import WhiteNoise
+    app.wsgi_app = WhiteNoise(
+        app.wsgi_app,
+        root=app.static_folder,
+        index_file=True,
+        autorefresh=False
+    )
+    WHITENOISE_AVAILABLE = True
+    print("✅ WhiteNoise enabled for static files")
+except Exception as e:
+    print(f"⚠️ WhiteNoise not available, Flask serves static files: {e}")
+    WHITENOISE_AVAILABLE = False
+
 # Enable CORS for all routes
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
 # Initialize extensions
-bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
 
 # Initialize Cloudinary (optional)
@@ -37,23 +56,277 @@ try:
 except Exception as e:
     print(f"⚠️ Cloudinary config error: {e}")
 
-# Initialize AI Matcher
+# Initialize AI Matcher (deep model when available, hash matcher otherwise)
 try:
-    face_matcher = FaceMatcher()
+    face_matcher = DeepFaceMatcher()
 except Exception as e:
-    print(f"⚠️ AI Matcher initialization error: {e}")
-    face_matcher = None
+    print(f"⚠️ DeepFaceMatcher unavailable, using hash matcher: {e}")
+    try:
+        face_matcher = FaceMatcher()
+    except Exception as e:
+        print(f"⚠️ AI Matcher initialization error: {e}")
+        face_matcher = None
+
+# Warm the matcher's embedding corpus from the stored report embeddings
+if face_matcher and hasattr(face_matcher, 'corpus_load'):
+    try:
+        face_matcher.corpus_load(MissingPerson.find_all(
+            {'status': {'$in': ['pending', 'approved']}},
+            projection={'name': 1, 'embedding': 1}
+        ))
+    except Exception as e:
+        print(f"⚠️ Embedding corpus load error: {e}")
+
+# orjson is optional but much faster for the large list responses
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _orjson_default(o):
+    if isinstance(o, ObjectId):
+        return str(o)
+    raise TypeError
+
+if orjson is not None:
+    from flask.json.provider import JSONProvider
+
+    class ORJSONProvider(JSONProvider):
+        """Routes every jsonify/response through orjson.
+
+        orjson serializes datetimes natively; ObjectIds go through the
+        default hook."""
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(
+                obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS
+            ).decode('utf-8')
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = ORJSONProvider(app)
+else:
+    from flask.json.provider import DefaultJSONProvider
+
+    class MongoJSONProvider(DefaultJSONProvider):
+        """stdlib fallback matching orjson's ObjectId/datetime handling"""
+
+        @staticmethod
+        def default(o):
+            if isinstance(o, ObjectId):
+                return str(o)
+            if isinstance(o, datetime):
+                return o.isoformat()
+            return DefaultJSONProvider.default(o)
+
+    app.json = MongoJSONProvider(app)
+
+def json_response(data, status=200):
+    """Serialize a response with orjson when available"""
+    if orjson is None:
+        return jsonify(data), status
+    payload = orjson.dumps(data, default=_orjson_default)
+    return app.response_class(payload, mimetype='application/json'), status
+
+# Short-TTL cache of encoded list responses; busted on writes
+try:
+    from cachetools import TTLCache
+    _list_cache = TTLCache(maxsize=1024, ttl=30)
+except ImportError:
+    _list_cache = None
+
+def cached_json(build):
+    """Serve this request from the list cache, building the response on miss.
+
+    Caches the already-encoded bytes so hits skip MongoDB and JSON
+    serialization entirely."""
+    if _list_cache is None:
+        return build()
+
+    key = (request.path, tuple(sorted(request.args.items())))
+    cached = _list_cache.get(key)
+    if cached is not None:
+        return app.response_class(cached, mimetype='application/json'), 200
+
+    response, status = build()
+    if status == 200:
+        _list_cache[key] = response.get_data()
+    return response, status
+
+def invalidate_list_cache():
+    """Drop cached list responses after a write"""
+    if _list_cache is not None:
+        _list_cache.clear()
+
+# Fast C-accelerated multipart parser (werkzeug's is the fallback)
+try:
+    from streaming_form_data import StreamingFormDataParser
+    from streaming_form_data.targets import BaseTarget, ValueTarget
+    STREAMING_AVAILABLE = True
+except ImportError:
+    STREAMING_AVAILABLE = False
+
+if STREAMING_AVAILABLE:
+    class MultiFileTarget(BaseTarget):
+        """Streams each part of a repeated file field into its own temp file"""
 
-# Custom JSON encoder for ObjectId
-class JSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, ObjectId):
-            return str(o)
-        if isinstance(o, datetime):
-            return o.isoformat()
-        return super().default(o)
+        def __init__(self):
+            super().__init__()
+            self.files = []
+            self._current = None
 
-app.json_encoder = JSONEncoder
+        def start(self):
+            self._current = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+
+        def data_received(self, chunk):
+            self._current.write(chunk)
+
+        def finish(self):
+            self._current.seek(0)
+            self.files.append(self._current)
+            self._current = None
+
+def parse_upload(req, field_names):
+    """Parse a multipart upload, streaming it when the fast parser exists.
+
+    Returns (fields, files): a dict of text fields and a list of file-like
+    objects for the 'images' field."""
+    content_type = req.content_type or ''
+    if not STREAMING_AVAILABLE or 'multipart/form-data' not in content_type:
+        return req.form.to_dict(), req.files.getlist('images')
+
+    parser = StreamingFormDataParser(headers=dict(req.headers))
+    values = {name: ValueTarget() for name in field_names}
+    for name, target in values.items():
+        parser.register(name, target)
+    images = MultiFileTarget()
+    parser.register('images', images)
+
+    # Feed the raw stream in 64KB chunks; werkzeug never parses the body
+    while True:
+        chunk = req.stream.read(65536)
+        if not chunk:
+            break
+        parser.data_received(chunk)
+
+    fields = {
+        name: target.value.decode('utf-8', 'replace')
+        for name, target in values.items() if target.value
+    }
+    return fields, images.files
+
+REPORT_FIELDS = ('name', 'age', 'gender', 'location', 'date', 'description', 'contact')
+UNIDENTIFIED_FIELDS = ('location', 'description')
+
+# Variants pre-rendered at upload time so searches skip resizing later
+EAGER_TRANSFORMATIONS = [
+    {'width': 299, 'height': 299, 'crop': 'fill'},
+    {'width': 16, 'height': 16, 'crop': 'fill'}
+]
+
+# One long-lived pool per process; spinning up threads per request wastes
+# the warm workers and their keep-alive connections
+UPLOAD_POOL = ThreadPoolExecutor(max_workers=8)
+
+def upload_images(files, folder):
+    """Upload files to Cloudinary in parallel, returning their URLs"""
+    files = files[:5]  # Limit to 5 images
+    if not Config.CLOUDINARY_CLOUD_NAME:
+        # Cloudinary not configured - use placeholders
+        return ['https://via.placeholder.com/300' for _ in files]
+
+    # Uploads are blocking HTTPS round-trips; overlap them
+    futures = [
+        UPLOAD_POOL.submit(
+            cloudinary.uploader.upload, file,
+            folder=folder, eager=EAGER_TRANSFORMATIONS
+        )
+        for file in files
+    ]
+    return [future.result()['secure_url'] for future in futures]
+
+# Only the fields the frontend list cards render; $slice keeps one image
+LIST_PROJECTION = {
+    'name': 1,
+    'age': 1,
+    'gender': 1,
+    'last_seen_location': 1,
+    'last_seen_date': 1,
+    'images': {'$slice': 1},
+    'status': 1,
+    'created_at': 1
+}
+
+def pagination_args():
+    """Read ?limit= and ?after= ('<ISO timestamp>_<id>' cursor) query args"""
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after')
+    if after:
+        try:
+            ts, _, last_id = after.partition('_')
+            after = (datetime.fromisoformat(ts), ObjectId(last_id))
+        except Exception:
+            after = None
+    return limit, after
+
+def paginated_response(items, timestamp_field='created_at'):
+    """Wrap a page of items with the cursor for the next page"""
+    next_cursor = None
+    if items:
+        last = items[-1]
+        ts = last.get(timestamp_field)
+        if isinstance(ts, datetime):
+            # Timestamp plus _id tie-break, mirroring the query's sort
+            next_cursor = f"{ts.isoformat()}_{last.get('_id')}"
+    return json_response({'items': items, 'next_cursor': next_cursor})
+
+def match_missing_persons(query_url, missing_persons, threshold=70):
+    """Match one unidentified image against all missing persons at once.
+
+    The query is embedded a single time, stored embeddings are stacked
+    into one float32 matrix, and all similarities come out of one matvec."""
+    query = face_matcher.embed(query_url)
+    if query is None:
+        return []
+
+    candidates = []
+    embeddings = []
+    for missing in missing_persons:
+        embedding = missing.get('embedding')
+        if embedding is not None:
+            embedding = np.frombuffer(embedding, dtype=np.float32)
+        elif missing.get('images'):
+            embedding = face_matcher.embed(missing['images'][0])
+        if embedding is None:
+            continue
+        candidates.append(missing)
+        embeddings.append(embedding)
+
+    if not candidates:
+        return []
+
+    similarities = face_matcher.batch_similarity(query, np.stack(embeddings))
+    return [
+        {
+            'missing_person_id': str(missing['_id']),
+            'name': missing['name'],
+            'similarity': float(similarity)
+        }
+        for missing, similarity in zip(candidates, similarities)
+        if similarity >= threshold
+    ]
+
+# Frontend is static; snapshot its file listing once so routing does an
+# O(1) set lookup instead of a stat() syscall per request
+def _scan_static_files():
+    return frozenset(
+        os.path.relpath(os.path.join(root, name), app.static_folder)
+        for root, _, names in os.walk(app.static_folder)
+        for name in names
+    )
+
+STATIC_FILES = _scan_static_files()
 
 # Serve frontend
 @app.route('/')
@@ -62,7 +335,7 @@ def serve_index():
 
 @app.route('/<path:path>')
 def serve_frontend(path):
-    if os.path.exists(os.path.join(app.static_folder, path)):
+    if path in STATIC_FILES:
         return send_from_directory(app.static_folder, path)
     return send_from_directory(app.static_folder, 'index.html')
 
@@ -163,6 +436,7 @@ def admin_login():
         if data.get('email') == Config.ADMIN_EMAIL and data.get('password') == Config.ADMIN_PASSWORD:
             access_token = create_access_token(
                 identity='admin',
+                additional_claims={'is_admin': True},
                 expires_delta=timedelta(days=1)
             )
             return jsonify({
@@ -182,22 +456,16 @@ def admin_login():
 
 @app.route('/api/missing-person/report', methods=['POST'])
 @jwt_required()
-def report_missing_person():
+async def report_missing_person():
     """Report a missing person"""
     try:
         user_id = get_jwt_identity()
-        
+
         # Handle multipart form data (for file uploads)
-        if request.files:
-            data = request.form.to_dict()
-            files = request.files.getlist('images')
-            
-            # Upload images (mock for now)
-            image_urls = []
-            for file in files[:5]:  # Limit to 5 images
-                # In production, upload to Cloudinary
-                # For now, use placeholder
-                image_urls.append('https://via.placeholder.com/300')
+        if 'multipart/form-data' in (request.content_type or ''):
+            data, files = parse_upload(request, REPORT_FIELDS)
+            # Keep the handler responsive while uploads are in flight
+            image_urls = await asyncio.to_thread(upload_images, files, 'missing')
         else:
             data = request.get_json()
             image_urls = data.get('images', ['https://via.placeholder.com/300'])
@@ -215,12 +483,42 @@ def report_missing_person():
             'images': image_urls,
             'status': 'pending'
         }
-        
+
+        # Embed the primary photo once at report time so later matching
+        # is a pure vector op with no download or model forward pass
+        if face_matcher and hasattr(face_matcher, 'embed') and image_urls:
+            embedding = await asyncio.to_thread(face_matcher.embed, image_urls[0])
+            if embedding is not None:
+                report_data['embedding'] = embedding.astype(np.float32).tobytes()
+
         result = MissingPerson.create(report_data)
-        
+        invalidate_list_cache()
+
+        report_id = str(result.inserted_id) if hasattr(result, 'inserted_id') else 'mock_id'
+
+        # Keep the in-memory corpus in step with the database
+        if 'embedding' in report_data and hasattr(face_matcher, 'corpus_add'):
+            face_matcher.corpus_add(
+                np.frombuffer(report_data['embedding'], dtype=np.float32),
+                report_id,
+                report_data.get('name', '')
+            )
+
+        # Check the new report against previously uploaded unidentified
+        # persons; their features live in the persistent ANN index
+        matches = []
+        if 'embedding' in report_data and hasattr(face_matcher, 'search_index'):
+            matches = await asyncio.to_thread(face_matcher.search_index, [image_urls[0]])
+            if matches:
+                MissingPerson.update_match(
+                    report_id, max(matches, key=lambda m: m['similarity'])
+                )
+
         return jsonify({
             'message': 'Missing person reported successfully',
-            'id': str(result.inserted_id) if hasattr(result, 'inserted_id') else 'mock_id'
+            'id': report_id,
+            'matches_found': len(matches),
+            'matches': matches
         }), 201
         
     except Exception as e:
@@ -232,8 +530,13 @@ def get_my_reports():
     """Get current user's reports"""
     try:
         user_id = get_jwt_identity()
-        reports = MissingPerson.find_all({'user_id': user_id})
-        return jsonify(reports), 200
+        limit, after = pagination_args()
+        reports = MissingPerson.find_all(
+            {'user_id': user_id}, projection={'embedding': 0}, limit=limit, after=after
+        )
+        if limit or after:
+            return paginated_response(reports)
+        return json_response(reports)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -241,8 +544,16 @@ def get_my_reports():
 def get_all_reports():
     """Get all missing person reports"""
     try:
-        reports = MissingPerson.find_all({'status': 'approved'})
-        return jsonify(reports), 200
+        def build():
+            limit, after = pagination_args()
+            reports = MissingPerson.find_all(
+                {'status': 'approved'}, projection=LIST_PROJECTION, limit=limit, after=after
+            )
+            if limit or after:
+                return paginated_response(reports)
+            return json_response(reports)
+
+        return cached_json(build)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -250,10 +561,9 @@ def get_all_reports():
 def get_report(person_id):
     """Get single report by ID"""
     try:
-        report = MissingPerson.find_by_id(person_id)
+        # Fetch and count the view in a single roundtrip
+        report = MissingPerson.get_and_increment_views(person_id)
         if report:
-            # Increment view count
-            MissingPerson.increment_views(person_id)
             return jsonify(report), 200
         return jsonify({'error': 'Report not found'}), 404
     except Exception as e:
@@ -267,50 +577,82 @@ def search():
         name = request.args.get('name', '')
         
         query = {'status': 'approved'}
-        
-        if location:
-            query['last_seen_location'] = {'$regex': location, '$options': 'i'}
+
+        # $text rides the compound text index; unanchored $regex cannot
         if name:
-            query['name'] = {'$regex': name, '$options': 'i'}
-        
-        results = MissingPerson.find_all(query)
-        return jsonify(results), 200
+            query['$text'] = {'$search': name}
+        if location:
+            # Anchored case-insensitive prefix regex: cheaper than the old
+            # unanchored scan, and combines cleanly with $text
+            query['last_seen_location'] = {
+                '$regex': f'^{re.escape(location)}', '$options': 'i'
+            }
+
+        def build():
+            limit, after = pagination_args()
+            results = MissingPerson.find_all(
+                query, projection=LIST_PROJECTION, limit=limit, after=after
+            )
+            if limit or after:
+                return paginated_response(results)
+            return json_response(results)
+
+        return cached_json(build)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Admin routes
+def admin_required(fn):
+    """Route decorator: verify the JWT once and check its admin claim"""
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        if not get_jwt().get('is_admin'):
+            return jsonify({'error': 'Unauthorized'}), 403
+        return current_app.ensure_sync(fn)(*args, **kwargs)
+    return wrapper
+
 @app.route('/api/admin/missing-person/<person_id>/status', methods=['PUT'])
-@jwt_required()
+@admin_required
 def update_status(person_id):
     """Update missing person status (admin only)"""
     try:
-        user_id = get_jwt_identity()
-        if user_id != 'admin':
-            return jsonify({'error': 'Unauthorized'}), 403
-        
         data = request.get_json()
         MissingPerson.update_status(person_id, data.get('status'))
-        
+        invalidate_list_cache()
+
         return jsonify({'message': 'Status updated successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/missing-person/bulk-status', methods=['PUT'])
+@admin_required
+def bulk_update_status():
+    """Update status for many missing persons at once (admin only)"""
+    try:
+        data = request.get_json()
+        ids = data.get('ids', [])
+        if not ids:
+            return jsonify({'error': 'No ids provided'}), 400
+
+        MissingPerson.bulk_update_status(ids, data.get('status'))
+        invalidate_list_cache()
+
+        return jsonify({'message': f'{len(ids)} statuses updated successfully'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/admin/unidentified/upload', methods=['POST'])
-@jwt_required()
-def upload_unidentified():
+@admin_required
+async def upload_unidentified():
     """Upload unidentified person (admin only)"""
     try:
-        user_id = get_jwt_identity()
-        if user_id != 'admin':
-            return jsonify({'error': 'Unauthorized'}), 403
-        
         # Handle file uploads
-        files = request.files.getlist('images')
-        location = request.form.get('location')
-        description = request.form.get('description')
-        
-        # Mock image URLs
-        image_urls = ['https://via.placeholder.com/300' for _ in files[:5]]
+        fields, files = parse_upload(request, UNIDENTIFIED_FIELDS)
+        location = fields.get('location')
+        description = fields.get('description')
+
+        image_urls = await asyncio.to_thread(upload_images, files, 'unidentified')
         
         # Create record
         unidentified = {
@@ -320,25 +662,43 @@ def upload_unidentified():
         }
         
         result = UnidentifiedPerson.create(unidentified)
-        
+
+        # Add features to the persistent index for future searches
+        if face_matcher and hasattr(face_matcher, 'index_add'):
+            face_matcher.index_add(
+                image_urls,
+                str(result.inserted_id) if hasattr(result, 'inserted_id') else 'mock_id'
+            )
+
         # Find matches
         matches = []
-        if face_matcher:
-            # Get all pending/approved missing persons
-            missing_persons = MissingPerson.find_all({'status': {'$in': ['pending', 'approved']}})
-            
-            for missing in missing_persons:
-                similarity = face_matcher.compare_faces(
-                    missing['images'][0] if missing['images'] else '',
-                    image_urls[0] if image_urls else ''
+        if face_matcher and image_urls:
+            if getattr(face_matcher, 'corpus', {}).get('ids'):
+                # Hot path: stored embeddings, no DB scan or downloads
+                matches = face_matcher.corpus_search(image_urls[0])
+            elif hasattr(face_matcher, 'embed'):
+                missing_persons = MissingPerson.find_all(
+                    {'status': {'$in': ['pending', 'approved']}}
                 )
-                
-                if similarity >= 70:
-                    matches.append({
-                        'missing_person_id': str(missing['_id']),
-                        'name': missing['name'],
-                        'similarity': similarity
-                    })
+                matches = match_missing_persons(image_urls[0], missing_persons)
+            else:
+                # Get all pending/approved missing persons
+                missing_persons = MissingPerson.find_all(
+                    {'status': {'$in': ['pending', 'approved']}}
+                )
+                # Hash matcher fallback: per-pair comparison
+                for missing in missing_persons:
+                    similarity = face_matcher.compare_faces(
+                        missing['images'][0] if missing['images'] else '',
+                        image_urls[0]
+                    )
+
+                    if similarity >= 70:
+                        matches.append({
+                            'missing_person_id': str(missing['_id']),
+                            'name': missing['name'],
+                            'similarity': similarity
+                        })
         
         return jsonify({
             'message': 'Unidentified person uploaded successfully',
@@ -350,17 +710,50 @@ def upload_unidentified():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/unidentified/batch', methods=['POST'])
+@admin_required
+def batch_upload_unidentified():
+    """Bulk-import unidentified records with already-hosted image URLs (admin only)"""
+    try:
+        data = request.get_json()
+        records = data if isinstance(data, list) else (data or {}).get('records', [])
+        if not records:
+            return jsonify({'error': 'No records provided'}), 400
+
+        docs = [{
+            'images': record.get('images', []),
+            'location': record.get('location'),
+            'description': record.get('description')
+        } for record in records]
+
+        result = UnidentifiedPerson.create_many(docs)
+        inserted = (result.inserted_ids if hasattr(result, 'inserted_ids')
+                    else result['inserted_ids'])
+        ids = [str(i) for i in inserted]
+
+        # Index features so future reports can be matched against them
+        if face_matcher and hasattr(face_matcher, 'index_add'):
+            for doc_id, doc in zip(ids, docs):
+                if doc['images']:
+                    face_matcher.index_add(doc['images'], doc_id)
+
+        return jsonify({
+            'message': f'{len(ids)} unidentified persons imported',
+            'ids': ids
+        }), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/admin/unidentified/all', methods=['GET'])
-@jwt_required()
+@admin_required
 def get_all_unidentified():
     """Get all unidentified persons (admin only)"""
     try:
-        user_id = get_jwt_identity()
-        if user_id != 'admin':
-            return jsonify({'error': 'Unauthorized'}), 403
-        
-        unidentified = UnidentifiedPerson.find_all()
-        return jsonify(unidentified), 200
+        limit, after = pagination_args()
+        unidentified = UnidentifiedPerson.find_all(limit=limit, after=after)
+        if limit or after:
+            return paginated_response(unidentified, timestamp_field='uploaded_at')
+        return json_response(unidentified)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
